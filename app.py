@@ -1,21 +1,134 @@
-from flask import Flask, jsonify, request, session, redirect, url_for, g
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    request,
+    session,
+    redirect,
+    url_for,
+    g,
+    stream_with_context,
+)
+from flask.json.provider import JSONProvider
 from werkzeug.security import generate_password_hash, check_password_hash
 from database import (
-    get_db_connection,
+    write_connection,
+    init_app,
     initialize_db,
     execute_query,
+    execute_insert,
+    execute_delete_returning,
     fetch_one,
     fetch_all,
+    fetch_all_compact,
+    iter_rows,
+    fetch_existing_attendance_sessions,
+    get_course_role,
+    invalidate_course_role,
 )
+from cachetools import TTLCache
 import os
 import time
-from functools import wraps
+import hmac
+import hashlib
+import secrets
+import threading
+from functools import wraps, lru_cache
+from itertools import chain
 import math
+import numpy as np
+import orjson
+
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson, used by jsonify and request.get_json."""
+
+    # Allow dicts keyed by ints (e.g. session ids), as the stdlib encoder does
+    options = orjson.OPT_NON_STR_KEYS
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.options).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Pass orjson's bytes straight to the response body instead of
+        # decoding them to str only for Werkzeug to encode them again
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=self.options), mimetype="application/json"
+        )
+
+
+def _load_or_create_secret_key(path):
+    """
+    Returns the secret key stored at `path`, generating one on first boot and
+    saving it (owner read/write only) so sessions survive restarts.
+    """
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+
+    # Write the key under a private name, then publish it with os.link, which
+    # fails if the file exists. Workers booting together either publish their
+    # key or read the winner's complete file, never an empty one.
+    key = os.urandom(32)
+    tmp_path = f"{path}.{os.getpid()}.{secrets.token_hex(8)}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(key)
+        os.link(tmp_path, path)
+    except FileExistsError:
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.remove(tmp_path)
+    return key
+
 
 app = Flask(__name__)
-app.secret_key = os.urandom(24)  # CHANGE THIS IN PRODUCTION!
+app.json = OrjsonProvider(app)
+# Set APP_SECRET_KEY in production; otherwise a key is kept in .secret_key
+app.secret_key = (
+    os.environ["APP_SECRET_KEY"].encode()
+    if os.environ.get("APP_SECRET_KEY")
+    else _load_or_create_secret_key(".secret_key")
+)
+
+# Assuming a small radius for "present", e.g., 0.1 km (100 meters)
+# You might want to make this configurable in Course settings
+PROXIMITY_RADIUS_KM = 0.1
+
+# Checked against when there is no real hash (e.g. unknown email) so password
+# verification always runs and response time does not reveal whether an
+# account exists. Same idea as a constant-time compare: never exit early on
+# the secret-dependent branch.
+_DUMMY_PASSWORD_HASH = generate_password_hash("dummy-password")
+
+# Recent successful sign-ins keyed by email, holding the password_hash that was
+# checked and an HMAC of the password. A repeat sign-in within the TTL still
+# reads the user's current hash, but is checked with one HMAC instead of the
+# deliberately slow password hash.
+_signin_cache = TTLCache(maxsize=1024, ttl=300)
+_signin_cache_lock = threading.Lock()
+
+# How long after signing in a user may delete their account with the session's
+# CSRF token instead of re-entering their password.
+REAUTH_WINDOW_SECONDS = 300
+
+# Haversine `a` term at exactly PROXIMITY_RADIUS_KM, so proximity checks can
+# compare `a` directly and skip the sqrt/asin of the full distance.
+_PROXIMITY_HAVERSINE_A = math.sin(PROXIMITY_RADIUS_KM / 6371 / 2) ** 2
+# Half-width of the pre-check bounding box (0.001 degrees, ~111 m of latitude),
+# slightly wider than PROXIMITY_RADIUS_KM so it never rejects a valid point.
+_PROXIMITY_BOX_RAD = math.radians(0.001)
 
 # Initialize the database when the app starts
+init_app(app)
 with app.app_context():
     initialize_db()
 
@@ -36,10 +149,156 @@ def login_required(f):
     return decorated_function
 
 
+# Attendance columns returned by the list endpoints. proof_base64 can be large,
+# so it is only included when the client asks for it with ?include_proof=1.
+ATTENDANCE_LIST_COLUMNS = (
+    "A.attendance_id, A.session_id, A.user_id, A.status, A.late_minutes, "
+    "A.user_geolocation_latitude, A.user_geolocation_longitude, A.joined_at"
+)
+
+
+def wants_proof():
+    """Whether the client asked for proofs in an attendance list."""
+    return request.args.get("include_proof") in ("1", "true")
+
+
+def attendance_columns():
+    """Returns the Attendances projection for a list query on this request."""
+    if wants_proof():
+        return ATTENDANCE_LIST_COLUMNS + ", A.proof_base64, A.proof_path"
+    return ATTENDANCE_LIST_COLUMNS
+
+
+# Proofs are stored as files under PROOF_DIR, one per attendance record under
+# a random name, and Attendances.proof_path points at them so the table's rows
+# stay small. Records written before this may still hold the proof in
+# proof_base64. Endpoints that delete attendance records (directly or by
+# cascade) must remove their files with remove_proofs.
+PROOF_DIR = "proofs"
+
+
+def store_proof(proof_base64):
+    """Writes a proof to a new file in PROOF_DIR and returns its path."""
+    os.makedirs(PROOF_DIR, exist_ok=True)
+    path = os.path.join(PROOF_DIR, secrets.token_hex(16) + ".bin")
+    # The record pointing at the file is inserted afterwards, so no reader can
+    # see it half written
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(proof_base64.encode())
+    return path
+
+
+def remove_proofs(paths):
+    """Deletes proof files, ignoring ones that are already gone."""
+    for path in paths:
+        if not path:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def read_proof(path):
+    """Returns the proof stored at path, or None if it cannot be read."""
+    try:
+        with open(path, "rb") as f:
+            return f.read().decode()
+    except OSError:
+        return None
+
+
+def load_proof(attendance):
+    """Replaces an attendance row's proof_path with the stored proof_base64."""
+    path = attendance.pop("proof_path", None)
+    if path:
+        attendance["proof_base64"] = read_proof(path)
+    return attendance
+
+
+def load_proofs_compact(columns, rows):
+    """load_proof for (columns, tuple rows) results; returns new columns and rows."""
+    path_index = columns.index("proof_path")
+    proof_index = columns.index("proof_base64")
+    loaded = []
+    for row in rows:
+        row = list(row)
+        path = row.pop(path_index)
+        if path:
+            row[proof_index] = read_proof(path)
+        loaded.append(row)
+    return columns[:path_index] + columns[path_index + 1 :], loaded
+
+
+def stream_json_rows(rows, head=b"[", tail=b"]", transform=None, batch_size=1000):
+    """
+    Serializes rows as a JSON array between head and tail, one batch of rows
+    per chunk, so a large result is never built up as one list or string.
+    """
+    yield head
+    separator = b""
+    batch = []
+    for row in rows:
+        batch.append(orjson.dumps(transform(row) if transform else row))
+        if len(batch) == batch_size:
+            yield separator + b",".join(batch)
+            separator = b","
+            batch = []
+    if batch:
+        yield separator + b",".join(batch)
+    yield tail
+
+
+def stream_json_response(rows, **kwargs):
+    """Returns a streaming JSON response over rows (see stream_json_rows)."""
+    return Response(
+        stream_with_context(stream_json_rows(rows, **kwargs)),
+        mimetype="application/json",
+    )
+
+
+def _signin_verifier(user_id, password):
+    """Returns a fast HMAC-SHA256 verifier of a user's password."""
+    message = f"{user_id}:{password}".encode()
+    return hmac.new(app.secret_key, message, hashlib.sha256).hexdigest()
+
+
+def check_cached_signin(user, password):
+    """
+    Returns True if this password was verified recently for the user against
+    the password_hash they still have, so signin can skip the slow hash check.
+    A changed or deleted account never matches, even in other workers.
+    """
+    with _signin_cache_lock:
+        cached = _signin_cache.get(user["email"])
+    if cached is None:
+        return False
+
+    password_hash, verifier = cached
+    return hmac.compare_digest(password_hash, user["password_hash"]) and (
+        hmac.compare_digest(verifier, _signin_verifier(user["user_id"], password))
+    )
+
+
+def cache_signin(user, password):
+    """Remembers a successful sign-in so a repeat within the TTL is cheap."""
+    verifier = _signin_verifier(user["user_id"], password)
+    with _signin_cache_lock:
+        _signin_cache[user["email"]] = (user["password_hash"], verifier)
+
+
+def forget_signin(email):
+    """Drops a cached sign-in, e.g. after the user's credentials change."""
+    with _signin_cache_lock:
+        _signin_cache.pop(email, None)
+
+
 def haversine_distance(lat1, lon1, lat2, lon2):
     """
     Calculate the distance between two points on Earth using the Haversine formula.
-    Returns distance in kilometers.
+    Returns distance in kilometers. Request paths use make_proximity_check or
+    haversine_distance_vec; this is kept as the scalar reference for both.
     """
     R = 6371  # Radius of Earth in kilometers
 
@@ -55,12 +314,91 @@ def haversine_distance(lat1, lon1, lat2, lon2):
         math.sin(dlat / 2) ** 2
         + math.cos(lat1_rad) * math.cos(lat2_rad) * math.sin(dlon / 2) ** 2
     )
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    # Clamp rounding error at antipodal points so asin stays in its domain
+    c = 2 * math.asin(math.sqrt(min(1.0, a)))
 
     distance = R * c
     return distance
 
 
+def prepare_course_location(latitude, longitude):
+    """
+    Returns (lat_rad, lon_rad, cos_lat) for a course location, or Nones if it
+    has no location. These are stored on the course when it is saved so that
+    attendance checks do not recompute them for every attendee.
+    """
+    if latitude is None or longitude is None:
+        return None, None, None
+    lat_rad = math.radians(float(latitude))
+    return lat_rad, math.radians(float(longitude)), math.cos(lat_rad)
+
+
+def parse_coordinate(value):
+    """
+    Converts a coordinate from a request body (number or numeric string) to a
+    float, keeping None. Raises ValueError/TypeError for anything else.
+    """
+    return None if value is None else float(value)
+
+
+@lru_cache(maxsize=1024)
+def make_proximity_check(lat1_rad, lon1_rad, cos_lat1):
+    """
+    Returns a function (lat2, lon2) -> bool that checks whether a point lies
+    within PROXIMITY_RADIUS_KM of a prepared origin from
+    prepare_course_location. The origin values, thresholds and math functions
+    are bound as closure locals and the function is cached per origin, so a
+    check is plain float arithmetic with no global or attribute lookups.
+    A bounding box rejects obviously distant points before any trig.
+    """
+    radians = math.radians
+    sin = math.sin
+    cos = math.cos
+    two_pi = 2 * math.pi
+    box_lat = _PROXIMITY_BOX_RAD
+    box_lon = _PROXIMITY_BOX_RAD / cos_lat1 if cos_lat1 > 0 else math.inf
+    threshold = _PROXIMITY_HAVERSINE_A
+
+    def is_within_proximity(lat2, lon2):
+        lat2_rad = radians(lat2)
+        dlat = lat2_rad - lat1_rad
+        dlon = radians(lon2) - lon1_rad
+
+        abs_dlon = abs(dlon)
+        if abs(dlat) > box_lat or min(abs_dlon, two_pi - abs_dlon) > box_lon:
+            return False  # Wraps across the antimeridian via two_pi - abs_dlon
+
+        a = sin(dlat / 2) ** 2 + cos_lat1 * cos(lat2_rad) * sin(dlon / 2) ** 2
+        return a <= threshold
+
+    return is_within_proximity
+
+
+def haversine_distance_vec(lats1, lons1, lats2, lons2):
+    """
+    Vectorized Haversine formula for batches of points. Accepts scalars or
+    array-likes (broadcast NumPy-style) and returns distances in kilometers as
+    a NumPy array. Use haversine_distance for single points; `math` is faster
+    than NumPy when there is nothing to vectorize over.
+    """
+    R = 6371  # Radius of Earth in kilometers
+
+    lat1_rad = np.radians(np.asarray(lats1, dtype=np.float64))
+    lon1_rad = np.radians(np.asarray(lons1, dtype=np.float64))
+    lat2_rad = np.radians(np.asarray(lats2, dtype=np.float64))
+    lon2_rad = np.radians(np.asarray(lons2, dtype=np.float64))
+
+    dlon = lon2_rad - lon1_rad
+    dlat = lat2_rad - lat1_rad
+
+    a = (
+        np.sin(dlat * 0.5) ** 2
+        + np.cos(lat1_rad) * np.cos(lat2_rad) * np.sin(dlon * 0.5) ** 2
+    )
+    # Clamp rounding error at antipodal points so arcsin stays in its domain
+    return 2 * R * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
 # --- General Routes ---
 @app.route("/")
 def home():
@@ -70,9 +408,7 @@ def home():
 @app.route("/logout", methods=["POST"])
 @login_required
 def logout():
-    session.pop("user_id", None)
-    session.pop("user_name", None)
-    session.pop("user_email", None)
+    session.clear()
     return jsonify({"message": "Logged out successfully."}), 200
 
 
@@ -91,6 +427,7 @@ def auth_status():
                         "name": session["user_name"],
                         "email": session["user_email"],
                     },
+                    "csrfToken": session.get("csrf_token"),
                 }
             ),
             200,
@@ -148,10 +485,21 @@ def signin():
         (email,),
     )
 
-    if user and check_password_hash(user["password_hash"], password):
+    if user and check_cached_signin(user, password):
+        password_matches = True
+    else:
+        # Always run the hash check, even for unknown emails (see _DUMMY_PASSWORD_HASH)
+        password_hash = user["password_hash"] if user else _DUMMY_PASSWORD_HASH
+        password_matches = check_password_hash(password_hash, password)
+        if user and password_matches:
+            cache_signin(user, password)
+
+    if user and password_matches:
         session["user_id"] = user["user_id"]
         session["user_name"] = user["name"]
         session["user_email"] = user["email"]
+        session["authn_at"] = int(time.time())
+        session["csrf_token"] = secrets.token_urlsafe(32)
         return (
             jsonify(
                 {
@@ -159,6 +507,7 @@ def signin():
                     "user_id": user["user_id"],
                     "name": user["name"],
                     "email": user["email"],
+                    "csrf_token": session["csrf_token"],
                 }
             ),
             200,
@@ -181,7 +530,7 @@ def get_user(user_id):
         (user_id,),
     )
     if user:
-        return jsonify(dict(user)), 200
+        return jsonify(user), 200
     else:
         return jsonify({"error": "User not found."}), 404
 
@@ -200,12 +549,9 @@ def update_user(user_id):
     email = data.get("email")
     password = data.get("password")
 
-    updates = []
-    params = []
+    hashed_password = None
 
     if name:
-        updates.append("name = ?")
-        params.append(name)
         session["user_name"] = name
     if email:
         existing_user_with_email = fetch_one(
@@ -214,22 +560,26 @@ def update_user(user_id):
         )
         if existing_user_with_email:
             return jsonify({"error": "Email already in use by another user."}), 409
-        updates.append("email = ?")
-        params.append(email)
         session["user_email"] = email
     if password:
         hashed_password = generate_password_hash(password)
-        updates.append("password_hash = ?")
-        params.append(hashed_password)
 
-    if not updates:
+    if not (name or email or password):
         return jsonify({"message": "No data provided for update."}), 200
 
-    params.append(user_id)
-    query = f"UPDATE Users SET {', '.join(updates)} WHERE user_id = ?"
+    # One fixed statement for any combination of fields, so SQLite can reuse
+    # the prepared plan; COALESCE keeps the current value of omitted fields
+    query = """
+        UPDATE Users SET
+            name = COALESCE(?, name),
+            email = COALESCE(?, email),
+            password_hash = COALESCE(?, password_hash)
+        WHERE user_id = ?
+    """
 
     try:
-        execute_query(query, tuple(params))
+        execute_query(query, (name or None, email or None, hashed_password, user_id))
+        forget_signin(g.user_email)
         return jsonify({"message": "User updated successfully."}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 409
@@ -246,26 +596,59 @@ def delete_user(user_id):
             403,
         )
 
-    data = request.get_json()
-    password_confirmation = data.get("password_confirmation")
+    # A recent sign-in plus the session's CSRF token stands in for the password,
+    # which would otherwise cost a full password hash check
+    csrf_token = request.headers.get("X-CSRF-Token", "")
+    expected_csrf_token = session.get("csrf_token", "")
+    recently_authenticated = (
+        time.time() - session.get("authn_at", 0) < REAUTH_WINDOW_SECONDS
+        and bool(csrf_token)
+        and bool(expected_csrf_token)
+        and hmac.compare_digest(csrf_token.encode(), expected_csrf_token.encode())
+    )
 
-    if not password_confirmation:
-        return (
-            jsonify({"error": "Password confirmation is required to delete account."}),
-            400,
-        )
+    if not recently_authenticated:
+        data = request.get_json(silent=True) or {}
+        password_confirmation = data.get("password_confirmation")
 
-    user = fetch_one("SELECT password_hash FROM Users WHERE user_id = ?", (user_id,))
-    if not user or not check_password_hash(
-        user["password_hash"], password_confirmation
-    ):
-        return jsonify({"error": "Incorrect password confirmation."}), 401
+        if not password_confirmation:
+            return (
+                jsonify(
+                    {"error": "Password confirmation is required to delete account."}
+                ),
+                400,
+            )
+
+        user = fetch_one(
+            "SELECT password_hash FROM Users WHERE user_id = ?", (user_id,)
+        )
+        password_hash = user["password_hash"] if user else _DUMMY_PASSWORD_HASH
+        password_matches = check_password_hash(password_hash, password_confirmation)
+        if not user or not password_matches:
+            return jsonify({"error": "Incorrect password confirmation."}), 401
 
     try:
-        execute_query("DELETE FROM Users WHERE user_id = ?", (user_id,))
-        session.pop("user_id", None)
-        session.pop("user_name", None)
-        session.pop("user_email", None)
+        # Deleting the user cascades to their attendance records and to every
+        # record in the courses they host; collect those proofs first
+        proofs = execute_delete_returning(
+            "DELETE FROM Users WHERE user_id = ?",
+            (user_id,),
+            """
+            SELECT proof_path FROM Attendances
+            WHERE user_id = ? AND proof_path IS NOT NULL
+            UNION
+            SELECT A.proof_path FROM Attendances A
+            JOIN Sessions S ON A.session_id = S.session_id
+            JOIN Courses C ON S.course_id = C.course_id
+            WHERE C.host_id = ? AND A.proof_path IS NOT NULL
+            """,
+            (user_id, user_id),
+        )
+        remove_proofs(row["proof_path"] for row in proofs)
+        forget_signin(g.user_email)
+        # Their hosted courses are gone too, so no cached role is safe to keep
+        invalidate_course_role()
+        session.clear()
         return jsonify({"message": "User deleted successfully."}), 200
     except RuntimeError as e:
         return jsonify({"error": str(e)}), 500
@@ -288,14 +671,24 @@ def create_course():
     if not all([name, join_code]):
         return jsonify({"error": "Course name and join code are required."}), 400
 
+    try:
+        geolocation_latitude = parse_coordinate(geolocation_latitude)
+        geolocation_longitude = parse_coordinate(geolocation_longitude)
+        geo_lat_rad, geo_lon_rad, geo_cos_lat = prepare_course_location(
+            geolocation_latitude, geolocation_longitude
+        )
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid geolocation coordinates."}), 400
+
     host_id = g.user_id
 
     try:
         query = """
             INSERT INTO Courses (
                 host_id, name, join_code, geolocation_latitude, geolocation_longitude,
+                geo_lat_rad, geo_lon_rad, geo_cos_lat,
                 late_threshold_minutes, present_threshold_minutes
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
         """
         course_id = execute_query(
             query,
@@ -305,10 +698,14 @@ def create_course():
                 join_code,
                 geolocation_latitude,
                 geolocation_longitude,
+                geo_lat_rad,
+                geo_lon_rad,
+                geo_cos_lat,
                 late_threshold_minutes,
                 present_threshold_minutes,
             ),
         )
+        invalidate_course_role(course_id=course_id)
         return (
             jsonify(
                 {
@@ -330,7 +727,11 @@ def create_course():
 @login_required
 def get_courses():
     query = """
-        SELECT DISTINCT C.*, U.name AS host_name FROM Courses C
+        SELECT DISTINCT C.course_id, C.host_id, C.name, C.join_code,
+               C.geolocation_latitude, C.geolocation_longitude, C.created_at,
+               C.late_threshold_minutes, C.present_threshold_minutes,
+               U.name AS host_name
+        FROM Courses C
         JOIN Users U ON C.host_id = U.user_id
         LEFT JOIN Enrollments E ON C.course_id = E.course_id
         WHERE C.host_id = ? OR E.user_id = ?
@@ -338,7 +739,7 @@ def get_courses():
     courses = fetch_all(query, (g.user_id, g.user_id))
 
     if courses:
-        return jsonify([dict(course) for course in courses]), 200
+        return jsonify(courses), 200
     else:
         return (
             jsonify(
@@ -353,18 +754,22 @@ def get_courses():
 @app.route("/courses/<int:course_id>", methods=["GET"])
 @login_required
 def get_course(course_id):
-    course = fetch_one(
-        "SELECT C.*, U.name AS host_name FROM Courses C JOIN Users U ON C.host_id = U.user_id WHERE course_id = ?",
-        (course_id,),
-    )
+    query = """
+        SELECT C.course_id, C.host_id, C.name, C.join_code,
+               C.geolocation_latitude, C.geolocation_longitude, C.created_at,
+               C.late_threshold_minutes, C.present_threshold_minutes,
+               U.name AS host_name, (E.user_id IS NOT NULL) AS is_enrolled
+        FROM Courses C
+        JOIN Users U ON C.host_id = U.user_id
+        LEFT JOIN Enrollments E ON E.course_id = C.course_id AND E.user_id = ?
+        WHERE C.course_id = ?
+    """
+    course = fetch_one(query, (g.user_id, course_id))
     if not course:
         return jsonify({"error": "Course not found."}), 404
 
     is_host = course["host_id"] == g.user_id
-    is_enrolled = fetch_one(
-        "SELECT 1 FROM Enrollments WHERE user_id = ? AND course_id = ?",
-        (g.user_id, course_id),
-    )
+    is_enrolled = course.pop("is_enrolled")
 
     if not is_host and not is_enrolled:
         return (
@@ -374,7 +779,7 @@ def get_course(course_id):
             403,
         )
 
-    return jsonify(dict(course)), 200
+    return jsonify(course), 200
 
 
 @app.route("/courses/<int:course_id>", methods=["PUT"])
@@ -388,21 +793,15 @@ def update_course(course_id):
     late_threshold_minutes = data.get("late_threshold_minutes")
     present_threshold_minutes = data.get("present_threshold_minutes")
 
-    course = fetch_one("SELECT host_id FROM Courses WHERE course_id = ?", (course_id,))
-    if not course:
+    course_role = get_course_role(g.user_id, course_id)
+    if not course_role:
         return jsonify({"error": "Course not found."}), 404
-    if course["host_id"] != g.user_id:
+    if course_role[0] != "host":
         return (
             jsonify({"error": "Access denied. You are not the host of this course."}),
             403,
         )
 
-    updates = []
-    params = []
-
-    if name:
-        updates.append("name = ?")
-        params.append(name)
     if join_code:
         existing_course_with_code = fetch_one(
             "SELECT course_id FROM Courses WHERE join_code = ? AND course_id != ?",
@@ -413,29 +812,66 @@ def update_course(course_id):
                 jsonify({"error": "Join code already in use by another course."}),
                 409,
             )
-        updates.append("join_code = ?")
-        params.append(join_code)
-    if geolocation_latitude is not None:
-        updates.append("geolocation_latitude = ?")
-        params.append(geolocation_latitude)
-    if geolocation_longitude is not None:
-        updates.append("geolocation_longitude = ?")
-        params.append(geolocation_longitude)
-    if late_threshold_minutes is not None:
-        updates.append("late_threshold_minutes = ?")
-        params.append(late_threshold_minutes)
-    if present_threshold_minutes is not None:
-        updates.append("present_threshold_minutes = ?")
-        params.append(present_threshold_minutes)
-
-    if not updates:
+
+    try:
+        geolocation_latitude = parse_coordinate(geolocation_latitude)
+        geolocation_longitude = parse_coordinate(geolocation_longitude)
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid geolocation coordinates."}), 400
+
+    prepared_location = (None, None, None)
+    if geolocation_latitude is not None or geolocation_longitude is not None:
+        # Recompute the prepared location from the full (new or current) pair
+        current = fetch_one(
+            "SELECT geolocation_latitude, geolocation_longitude FROM Courses WHERE course_id = ?",
+            (course_id,),
+        )
+        try:
+            prepared_location = prepare_course_location(
+                (
+                    geolocation_latitude
+                    if geolocation_latitude is not None
+                    else current["geolocation_latitude"]
+                ),
+                (
+                    geolocation_longitude
+                    if geolocation_longitude is not None
+                    else current["geolocation_longitude"]
+                ),
+            )
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid geolocation coordinates."}), 400
+
+    params = (
+        name or None,
+        join_code or None,
+        geolocation_latitude,
+        geolocation_longitude,
+        *prepared_location,
+        late_threshold_minutes,
+        present_threshold_minutes,
+    )
+    if all(param is None for param in params):
         return jsonify({"message": "No data provided for update."}), 200
 
-    params.append(course_id)
-    query = f"UPDATE Courses SET {', '.join(updates)} WHERE course_id = ?"
+    # One fixed statement for any combination of fields, so SQLite can reuse
+    # the prepared plan; COALESCE keeps the current value of omitted fields
+    query = """
+        UPDATE Courses SET
+            name = COALESCE(?, name),
+            join_code = COALESCE(?, join_code),
+            geolocation_latitude = COALESCE(?, geolocation_latitude),
+            geolocation_longitude = COALESCE(?, geolocation_longitude),
+            geo_lat_rad = COALESCE(?, geo_lat_rad),
+            geo_lon_rad = COALESCE(?, geo_lon_rad),
+            geo_cos_lat = COALESCE(?, geo_cos_lat),
+            late_threshold_minutes = COALESCE(?, late_threshold_minutes),
+            present_threshold_minutes = COALESCE(?, present_threshold_minutes)
+        WHERE course_id = ?
+    """
 
     try:
-        execute_query(query, tuple(params))
+        execute_query(query, (*params, course_id))
         return jsonify({"message": "Course updated successfully."}), 200
     except ValueError as e:
         return jsonify({"error": str(e)}), 409
@@ -446,17 +882,28 @@ def update_course(course_id):
 @app.route("/courses/<int:course_id>", methods=["DELETE"])
 @login_required
 def delete_course(course_id):
-    course = fetch_one("SELECT host_id FROM Courses WHERE course_id = ?", (course_id,))
-    if not course:
+    course_role = get_course_role(g.user_id, course_id)
+    if not course_role:
         return jsonify({"error": "Course not found."}), 404
-    if course["host_id"] != g.user_id:
+    if course_role[0] != "host":
         return (
             jsonify({"error": "Access denied. You are not the host of this course."}),
             403,
         )
 
     try:
-        execute_query("DELETE FROM Courses WHERE course_id = ?", (course_id,))
+        proofs = execute_delete_returning(
+            "DELETE FROM Courses WHERE course_id = ?",
+            (course_id,),
+            """
+            SELECT A.proof_path FROM Attendances A
+            JOIN Sessions S ON A.session_id = S.session_id
+            WHERE S.course_id = ? AND A.proof_path IS NOT NULL
+            """,
+            (course_id,),
+        )
+        remove_proofs(row["proof_path"] for row in proofs)
+        invalidate_course_role(course_id=course_id)
         return jsonify({"message": "Course deleted successfully."}), 200
     except RuntimeError as e:
         return jsonify({"error": str(e)}), 500
@@ -493,6 +940,7 @@ def enroll_in_course():
     try:
         query = "INSERT INTO Enrollments (user_id, course_id) VALUES (?, ?)"
         execute_query(query, (g.user_id, course["course_id"]))
+        invalidate_course_role(g.user_id, course["course_id"])
         return (
             jsonify(
                 {
@@ -530,7 +978,7 @@ def get_user_enrollments(user_id):
     enrollments = fetch_all(query, (user_id,))
 
     if enrollments:
-        return jsonify([dict(e) for e in enrollments]), 200
+        return jsonify(enrollments), 200
     else:
         # UPDATED: Return an empty list with a 200 OK status
         return jsonify([]), 200
@@ -564,7 +1012,7 @@ def get_course_attendees(course_id):
                 {
                     "course_id": course_id,
                     "course_name": course["name"],
-                    "attendees": [dict(a) for a in attendees],
+                    "attendees": attendees,
                 }
             ),
             200,
@@ -581,9 +1029,14 @@ def unenroll_from_course():
 
     if not course_id:
         return jsonify({"error": "Course ID is required to unenroll."}), 400
+    # Role cache keys hold integer course ids, so "1" must become 1 here
+    try:
+        course_id = int(course_id)
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid course ID."}), 400
 
     enrollment = fetch_one(
-        "SELECT * FROM Enrollments WHERE user_id = ? AND course_id = ?",
+        "SELECT 1 FROM Enrollments WHERE user_id = ? AND course_id = ?",
         (g.user_id, course_id),
     )
     if not enrollment:
@@ -594,6 +1047,7 @@ def unenroll_from_course():
             "DELETE FROM Enrollments WHERE user_id = ? AND course_id = ?",
             (g.user_id, course_id),
         )
+        invalidate_course_role(g.user_id, course_id)
         return jsonify({"message": "Successfully unenrolled from course."}), 200
     except RuntimeError as e:
         return jsonify({"error": str(e)}), 500
@@ -667,17 +1121,11 @@ def create_session(course_id):
 @login_required
 def get_course_sessions(course_id):
     # Check if user is host or enrolled in the course to view sessions
-    course = fetch_one("SELECT host_id FROM Courses WHERE course_id = ?", (course_id,))
-    if not course:
+    course_role = get_course_role(g.user_id, course_id)
+    if not course_role:
         return jsonify({"error": "Course not found."}), 404
 
-    is_host = course["host_id"] == g.user_id
-    is_enrolled = fetch_one(
-        "SELECT 1 FROM Enrollments WHERE user_id = ? AND course_id = ?",
-        (g.user_id, course_id),
-    )
-
-    if not is_host and not is_enrolled:
+    if course_role[0] == "none":
         return (
             jsonify(
                 {
@@ -692,7 +1140,7 @@ def get_course_sessions(course_id):
         (course_id,),
     )
     if sessions:
-        return jsonify([dict(s) for s in sessions]), 200
+        return jsonify(sessions), 200
     else:
         return jsonify({"message": "No sessions found for this course."}), 404
 
@@ -700,23 +1148,21 @@ def get_course_sessions(course_id):
 @app.route("/sessions/<int:session_id>", methods=["GET"])
 @login_required
 def get_session(session_id):
-    session_data = fetch_one(
-        "SELECT * FROM Sessions WHERE session_id = ?", (session_id,)
-    )
+    # Session, course host and enrollment in a single query
+    query = """
+        SELECT S.*, C.host_id, (E.user_id IS NOT NULL) AS is_enrolled
+        FROM Sessions S
+        JOIN Courses C ON S.course_id = C.course_id
+        LEFT JOIN Enrollments E ON E.course_id = S.course_id AND E.user_id = ?
+        WHERE S.session_id = ?
+    """
+    session_data = fetch_one(query, (g.user_id, session_id))
     if not session_data:
         return jsonify({"error": "Session not found."}), 404
 
     # Check if user is host or enrolled in the course to view session details
-    course_id = session_data["course_id"]
-    course = fetch_one("SELECT host_id FROM Courses WHERE course_id = ?", (course_id,))
-    if not course:  # Should not happen if data integrity is maintained
-        return jsonify({"error": "Associated course not found."}), 500
-
-    is_host = course["host_id"] == g.user_id
-    is_enrolled = fetch_one(
-        "SELECT 1 FROM Enrollments WHERE user_id = ? AND course_id = ?",
-        (g.user_id, course_id),
-    )
+    is_host = session_data.pop("host_id") == g.user_id
+    is_enrolled = session_data.pop("is_enrolled")
 
     if not is_host and not is_enrolled:
         return (
@@ -726,22 +1172,25 @@ def get_session(session_id):
             403,
         )
 
-    return jsonify(dict(session_data)), 200
+    return jsonify(session_data), 200
 
 
 @app.route("/sessions/<int:session_id>", methods=["PUT"])
 @login_required
 def update_session(session_id):
     session_data = fetch_one(
-        "SELECT course_id, start_time, end_time FROM Sessions WHERE session_id = ?",
+        """
+        SELECT S.start_time, S.end_time, C.host_id
+        FROM Sessions S
+        LEFT JOIN Courses C ON S.course_id = C.course_id
+        WHERE S.session_id = ?
+        """,
         (session_id,),
     )
     if not session_data:
         return jsonify({"error": "Session not found."}), 404
 
-    course_id = session_data["course_id"]
-    course = fetch_one("SELECT host_id FROM Courses WHERE course_id = ?", (course_id,))
-    if not course or course["host_id"] != g.user_id:
+    if session_data["host_id"] != g.user_id:
         return (
             jsonify(
                 {
@@ -755,14 +1204,9 @@ def update_session(session_id):
     start_time = data.get("start_time")
     end_time = data.get("end_time")
 
-    updates = []
-    params = []
-
     if start_time is not None:
         try:
             start_time = int(start_time)
-            updates.append("start_time = ?")
-            params.append(start_time)
         except (ValueError, TypeError):
             return (
                 jsonify(
@@ -774,8 +1218,6 @@ def update_session(session_id):
     if end_time is not None:
         try:
             end_time = int(end_time)
-            updates.append("end_time = ?")
-            params.append(end_time)
         except (ValueError, TypeError):
             return (
                 jsonify({"error": "Invalid end_time format. Use Unix epoch integer."}),
@@ -796,14 +1238,19 @@ def update_session(session_id):
     ):
         return jsonify({"error": "End time cannot be before start time."}), 400
 
-    if not updates:
+    if start_time is None and end_time is None:
         return jsonify({"message": "No data provided for update."}), 200
 
-    params.append(session_id)
-    query = f"UPDATE Sessions SET {', '.join(updates)} WHERE session_id = ?"
+    # COALESCE keeps the current value of an omitted field (see update_user)
+    query = """
+        UPDATE Sessions SET
+            start_time = COALESCE(?, start_time),
+            end_time = COALESCE(?, end_time)
+        WHERE session_id = ?
+    """
 
     try:
-        execute_query(query, tuple(params))
+        execute_query(query, (start_time, end_time, session_id))
         return jsonify({"message": "Session updated successfully."}), 200
     except RuntimeError as e:
         return jsonify({"error": str(e)}), 500
@@ -813,14 +1260,18 @@ def update_session(session_id):
 @login_required
 def delete_session(session_id):
     session_data = fetch_one(
-        "SELECT course_id FROM Sessions WHERE session_id = ?", (session_id,)
+        """
+        SELECT C.host_id
+        FROM Sessions S
+        LEFT JOIN Courses C ON S.course_id = C.course_id
+        WHERE S.session_id = ?
+        """,
+        (session_id,),
     )
     if not session_data:
         return jsonify({"error": "Session not found."}), 404
 
-    course_id = session_data["course_id"]
-    course = fetch_one("SELECT host_id FROM Courses WHERE course_id = ?", (course_id,))
-    if not course or course["host_id"] != g.user_id:
+    if session_data["host_id"] != g.user_id:
         return (
             jsonify(
                 {
@@ -831,7 +1282,13 @@ def delete_session(session_id):
         )
 
     try:
-        execute_query("DELETE FROM Sessions WHERE session_id = ?", (session_id,))
+        proofs = execute_delete_returning(
+            "DELETE FROM Sessions WHERE session_id = ?",
+            (session_id,),
+            "SELECT proof_path FROM Attendances WHERE session_id = ? AND proof_path IS NOT NULL",
+            (session_id,),
+        )
+        remove_proofs(row["proof_path"] for row in proofs)
         return jsonify({"message": "Session deleted successfully."}), 200
     except RuntimeError as e:
         return jsonify({"error": str(e)}), 500
@@ -845,37 +1302,50 @@ def delete_session(session_id):
 def mark_attendance(session_id):
     attendee_id = g.user_id
 
-    session_data = fetch_one(
-        "SELECT course_id, start_time, end_time FROM Sessions WHERE session_id = ?",
-        (session_id,),
-    )
+    # Session times, course settings and enrollment in a single query
+    query = """
+        SELECT S.start_time, S.end_time, C.host_id,
+               C.geolocation_latitude, C.geolocation_longitude,
+               C.geo_lat_rad, C.geo_lon_rad, C.geo_cos_lat,
+               C.late_threshold_minutes, C.present_threshold_minutes,
+               EXISTS (
+                   SELECT 1 FROM Enrollments E
+                   WHERE E.user_id = ? AND E.course_id = C.course_id
+               ) AS enrolled
+        FROM Sessions S
+        JOIN Courses C ON S.course_id = C.course_id
+        WHERE S.session_id = ?
+    """
+    session_data = fetch_one(query, (attendee_id, session_id))
     if not session_data:
         return jsonify({"error": "Session not found."}), 404
 
-    # Check if user is enrolled in the course
-    course_id = session_data["course_id"]
-    enrollment = fetch_one(
-        "SELECT 1 FROM Enrollments WHERE user_id = ? AND course_id = ?",
-        (attendee_id, course_id),
+    # Only geofenced courses check the attendee's location
+    geo_required = (
+        session_data["geolocation_latitude"] is not None
+        and session_data["geolocation_longitude"] is not None
     )
-    if not enrollment:
+
+    # Check if user is enrolled in the course
+    if not session_data["enrolled"]:
         return jsonify({"error": "You are not enrolled in this course."}), 403
 
     # Check if user is the host
-    course = fetch_one(
-        "SELECT host_id, geolocation_latitude, geolocation_longitude, late_threshold_minutes, present_threshold_minutes FROM Courses WHERE course_id = ?",
-        (course_id,),
-    )
-    if course["host_id"] == attendee_id:
+    if session_data["host_id"] == attendee_id:
         return (
             jsonify({"error": "Hosts cannot mark attendance for their own sessions."}),
             400,
         )
 
     data = request.get_json()
-    user_latitude = data.get("user_geolocation_latitude")
-    user_longitude = data.get("user_geolocation_longitude")
     proof_base64 = data.get("proof_base64")
+    # Validated and stored on every record, so a fence added later can still
+    # be verified against them
+    try:
+        user_latitude = parse_coordinate(data.get("user_geolocation_latitude"))
+        user_longitude = parse_coordinate(data.get("user_geolocation_longitude"))
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid geolocation coordinates."}), 400
 
     current_time = int(time.time())
 
@@ -890,8 +1360,8 @@ def mark_attendance(session_id):
         else (session_start_time + 3600)
     )  # Default to 1 hour if no end_time
 
-    late_threshold_seconds = course["late_threshold_minutes"] * 60
-    present_threshold_seconds = course["present_threshold_minutes"] * 60
+    late_threshold_seconds = session_data["late_threshold_minutes"] * 60
+    present_threshold_seconds = session_data["present_threshold_minutes"] * 60
 
     if (
         session_start_time - present_threshold_seconds
@@ -917,23 +1387,24 @@ def mark_attendance(session_id):
         )
 
     # Geolocation check
-    if (
-        course["geolocation_latitude"] is not None
-        and course["geolocation_longitude"] is not None
-    ):
+    if geo_required:
         if user_latitude is None or user_longitude is None:
             return jsonify({"error": "Geolocation is required for this session."}), 400
 
         try:
-            distance = haversine_distance(
-                course["geolocation_latitude"],
-                course["geolocation_longitude"],
-                user_latitude,
-                user_longitude,
+            origin = (
+                session_data["geo_lat_rad"],
+                session_data["geo_lon_rad"],
+                session_data["geo_cos_lat"],
             )
-            # Assuming a small radius for "present", e.g., 0.1 km (100 meters)
-            # You might want to make this configurable in Course settings
-            if distance > 0.1:  # Example: 100 meters radius
+            if session_data["geo_cos_lat"] is None:
+                # Course saved before the prepared columns were added
+                origin = prepare_course_location(
+                    session_data["geolocation_latitude"],
+                    session_data["geolocation_longitude"],
+                )
+            is_within_proximity = make_proximity_check(*origin)
+            if not is_within_proximity(user_latitude, user_longitude):
                 return (
                     jsonify(
                         {
@@ -949,36 +1420,55 @@ def mark_attendance(session_id):
     # if proof_required and not proof_base64:
     #     return jsonify({"error": "Proof is required for attendance."}), 400
 
-    # Check if attendance already exists for this user and session
-    existing_attendance = fetch_one(
-        "SELECT * FROM Attendances WHERE user_id = ? AND session_id = ?",
-        (attendee_id, session_id),
-    )
-    if existing_attendance:
-        return (
-            jsonify({"error": "You have already marked attendance for this session."}),
-            409,
-        )
+    if proof_base64 is not None and not isinstance(proof_base64, str):
+        return jsonify({"error": "Invalid proof."}), 400
 
     try:
+        proof_path = store_proof(proof_base64) if proof_base64 else None
+        # The insert re-checks enrollment and skips existing records itself, so
+        # no row means the attendee was already marked or has just unenrolled
         query = """
             INSERT INTO Attendances (
                 user_id, session_id, status, joined_at, user_geolocation_latitude,
-                user_geolocation_longitude, proof_base64
-            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+                user_geolocation_longitude, proof_path
+            )
+            SELECT E.user_id, S.session_id, ?, ?, ?, ?, ?
+            FROM Sessions S
+            JOIN Enrollments E ON E.course_id = S.course_id
+            WHERE S.session_id = ? AND E.user_id = ?
+            ON CONFLICT (session_id, user_id) DO NOTHING
         """
-        attendance_id = execute_query(
-            query,
-            (
-                attendee_id,
-                session_id,
-                status,
-                current_time,
-                user_latitude,
-                user_longitude,
-                proof_base64,
-            ),
-        )
+        try:
+            attendance_id = execute_insert(
+                query,
+                (
+                    status,
+                    current_time,
+                    user_latitude,
+                    user_longitude,
+                    proof_path,
+                    session_id,
+                    attendee_id,
+                ),
+            )
+        except Exception:
+            remove_proofs([proof_path])
+            raise
+        if attendance_id is None:
+            remove_proofs([proof_path])
+            already_marked = fetch_one(
+                "SELECT 1 FROM Attendances WHERE user_id = ? AND session_id = ? LIMIT 1",
+                (attendee_id, session_id),
+            )
+            if already_marked:
+                return (
+                    jsonify(
+                        {"error": "You have already marked attendance for this session."}
+                    ),
+                    409,
+                )
+            return jsonify({"error": "You are not enrolled in this course."}), 403
+
         return (
             jsonify(
                 {
@@ -992,6 +1482,8 @@ def mark_attendance(session_id):
             ),
             201,
         )
+    except OSError:
+        return jsonify({"error": "Could not store attendance proof."}), 500
     except RuntimeError as e:
         return jsonify({"error": str(e)}), 500
 
@@ -1006,9 +1498,16 @@ def mark_absent_for_unattended(session_id):
     """
     user_id = g.user_id
 
-    # 1. Fetch session details to get course_id and times
+    # 1. Fetch session times together with the course host and thresholds
     session_data = fetch_one(
-        "SELECT * FROM Sessions WHERE session_id = ?", (session_id,)
+        """
+        SELECT S.course_id, S.start_time, S.end_time,
+               C.host_id, C.late_threshold_minutes
+        FROM Sessions S
+        LEFT JOIN Courses C ON S.course_id = C.course_id
+        WHERE S.session_id = ?
+        """,
+        (session_id,),
     )
     if not session_data:
         return jsonify({"error": "Session not found."}), 404
@@ -1016,17 +1515,13 @@ def mark_absent_for_unattended(session_id):
     course_id = session_data["course_id"]
 
     # 2. Verify user is the host of the course
-    course_data = fetch_one(
-        "SELECT host_id, late_threshold_minutes, present_threshold_minutes FROM Courses WHERE course_id = ?",
-        (course_id,),
-    )
-    if not course_data:
+    if session_data["host_id"] is None:
         return (
             jsonify({"error": "Course not found."}),
             404,
         )  # Should not happen if session_data was found
 
-    if course_data["host_id"] != user_id:
+    if session_data["host_id"] != user_id:
         return (
             jsonify(
                 {
@@ -1050,8 +1545,8 @@ def mark_absent_for_unattended(session_id):
     # From previous logic: `current_time <= session_end_time + late_threshold_seconds`
     # So, for the window to be closed, `current_time > session_end_time + late_threshold_seconds`
     late_threshold_seconds = (
-        course_data["late_threshold_minutes"] * 60
-        if course_data["late_threshold_minutes"] is not None
+        session_data["late_threshold_minutes"] * 60
+        if session_data["late_threshold_minutes"] is not None
         else 0
     )
 
@@ -1065,108 +1560,84 @@ def mark_absent_for_unattended(session_id):
             400,
         )
 
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    marked_absent_count = 0
-    errors = []
+    # Use the shared write connection so the batch is serialized with every
+    # other write instead of racing it for the database lock
+    with write_connection() as conn:
+        cursor = conn.cursor()
 
-    try:
-        # 4. Identify enrolled attendees who do NOT have an attendance record for this session
-        unmarked_attendees_query = """
-            SELECT U.user_id, U.name, U.email
-            FROM Users U
-            JOIN Enrollments E ON U.user_id = E.user_id
-            WHERE E.course_id = ?
-            AND NOT EXISTS (
-                SELECT 1 FROM Attendances A
-                WHERE A.session_id = ? AND A.user_id = U.user_id
-            );
-        """
-        cursor.execute(unmarked_attendees_query, (course_id, session_id))
-        unmarked_attendees = cursor.fetchall()
+        try:
+            # 4. Insert an 'Absent' record for every enrolled attendee who has no
+            # attendance record for this session, in one atomic statement
+            cursor.execute(
+                """
+                INSERT INTO Attendances (session_id, user_id, status, joined_at)
+                SELECT ?, E.user_id, 'Absent', ?
+                FROM Enrollments E
+                JOIN Users U ON U.user_id = E.user_id
+                WHERE E.course_id = ?
+                AND NOT EXISTS (
+                    SELECT 1 FROM Attendances A
+                    WHERE A.session_id = ? AND A.user_id = E.user_id
+                )
+                ON CONFLICT DO NOTHING
+                """,
+                (session_id, current_time, course_id, session_id),
+            )
+            marked_absent_count = cursor.rowcount
+
+            if marked_absent_count == 0:
+                return (
+                    jsonify(
+                        {
+                            "message": "No unattended attendees found to mark absent for this session."
+                        }
+                    ),
+                    200,
+                )
 
-        if not unmarked_attendees:
             return (
                 jsonify(
                     {
-                        "message": "No unattended attendees found to mark absent for this session."
+                        "message": f"Successfully marked {marked_absent_count} unattended attendees as Absent.",
+                        "marked_absent_count": marked_absent_count,
                     }
                 ),
                 200,
             )
 
-        # 5. Insert 'Absent' records for each identified user
-        for attendee in unmarked_attendees:
-            attendee_id = attendee["user_id"]
-            try:
-                execute_query(
-                    """
-                    INSERT INTO Attendances (session_id, user_id, status, joined_at)
-                    VALUES (?, ?, ?, ?)
-                    """,
-                    (session_id, attendee_id, "Absent", int(time.time())),
-                )
-                marked_absent_count += 1
-            except ValueError as e:
-                # Handle cases where an attendee might have concurrent access or other integrity issues
-                errors.append(
-                    f"Failed to mark {attendee['name']} ({attendee['email']}) absent: {e}"
-                )
-            except RuntimeError as e:
-                errors.append(
-                    f"Database error for {attendee['name']} ({attendee['email']}): {e}"
-                )
-
-        conn.commit()  # Commit changes after loop
-
-        response_message = (
-            f"Successfully marked {marked_absent_count} unattended attendees as Absent."
-        )
-        if errors:
-            response_message += " Some errors occurred: " + "; ".join(errors)
-
-        return (
-            jsonify(
-                {
-                    "message": response_message,
-                    "marked_absent_count": marked_absent_count,
-                    "errors": errors,
-                }
-            ),
-            200,
-        )
-
-    except Exception as e:
-        conn.rollback()  # Rollback on any major error
-        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
-    finally:
-        conn.close()
+        except Exception as e:
+            conn.rollback()  # Rollback on any major error
+            return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+        finally:
+            cursor.close()
 
 
 @app.route("/attendances/<int:attendance_id>", methods=["GET"])
 @login_required
 def get_attendance(attendance_id):
+    # Fetch the record together with its course host for the authorization check
     attendance = fetch_one(
-        "SELECT * FROM Attendances WHERE attendance_id = ?", (attendance_id,)
+        """
+        SELECT A.*, S.course_id, C.host_id
+        FROM Attendances A
+        LEFT JOIN Sessions S ON A.session_id = S.session_id
+        LEFT JOIN Courses C ON S.course_id = C.course_id
+        WHERE A.attendance_id = ?
+        """,
+        (attendance_id,),
     )
     if not attendance:
         return jsonify({"error": "Attendance record not found."}), 404
 
-    # Get associated session and course to check authorization
-    session_data = fetch_one(
-        "SELECT course_id FROM Sessions WHERE session_id = ?",
-        (attendance["session_id"],),
-    )
-    if not session_data:
+    course_id = attendance.pop("course_id")
+    host_id = attendance.pop("host_id")
+    if course_id is None:
         return jsonify({"error": "Associated session not found."}), 500
-    course = fetch_one(
-        "SELECT host_id FROM Courses WHERE course_id = ?", (session_data["course_id"],)
-    )
-    if not course:
+    if host_id is None:
         return jsonify({"error": "Associated course not found."}), 500
 
     # User can view their own attendance, or course host can view attendance for their course
-    if attendance["user_id"] != g.user_id and course["host_id"] != g.user_id:
+    if attendance["user_id"] != g.user_id and host_id != g.user_id:
         return (
             jsonify(
                 {
@@ -1176,7 +1647,7 @@ def get_attendance(attendance_id):
             403,
         )
 
-    return jsonify(dict(attendance)), 200
+    return jsonify(load_proof(attendance)), 200
 
 
 @app.route("/users/<int:user_id>/attendances", methods=["GET"])
@@ -1192,28 +1663,90 @@ def get_user_all_attendances(user_id):
             403,
         )
 
-    query = """
-        SELECT A.*, S.start_time AS session_start_time, S.end_time AS session_end_time,
-               C.name AS course_name, C.course_id
+    query = f"""
+        SELECT {attendance_columns()}, S.start_time AS session_start_time,
+               S.end_time AS session_end_time, C.name AS course_name, C.course_id
         FROM Attendances A
         JOIN Sessions S ON A.session_id = S.session_id
         JOIN Courses C ON S.course_id = C.course_id
         WHERE A.user_id = ?
         ORDER BY A.joined_at DESC
     """
-    attendances = fetch_all(query, (user_id,))
-
-    if attendances:
-        return jsonify([dict(a) for a in attendances]), 200
-    else:
+    # Rows are streamed straight from the cursor; peek at the first one to
+    # keep answering 404 for users with no records
+    attendances = iter_rows(query, (user_id,))
+    first = next(attendances, None)
+    if first is None:
         return jsonify({"message": "No attendance records found for this user."}), 404
 
+    return (
+        stream_json_response(
+            chain([first], attendances),
+            transform=load_proof if wants_proof() else None,
+        ),
+        200,
+    )
+
+
+@app.route("/users/<int:user_id>/attendance_status", methods=["GET"])
+@login_required
+def get_user_attendance_status(user_id):
+    """
+    Reports which of the given sessions (?session_ids=1,2,3) the user has
+    already marked attendance for, checked in a single batched lookup.
+    """
+    if g.user_id != user_id:
+        return (
+            jsonify(
+                {
+                    "error": "Access denied. You can only view your own attendance records."
+                }
+            ),
+            403,
+        )
+
+    raw_session_ids = request.args.get("session_ids", "")
+    try:
+        session_ids = {int(s) for s in raw_session_ids.split(",") if s.strip()}
+    except ValueError:
+        return (
+            jsonify(
+                {"error": "session_ids must be a comma-separated list of integers."}
+            ),
+            400,
+        )
+    if not session_ids:
+        return jsonify({"error": "session_ids is required."}), 400
+
+    try:
+        marked = fetch_existing_attendance_sessions(user_id, session_ids)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 500
+
+    return (
+        jsonify(
+            {
+                "user_id": user_id,
+                "attendance_marked": {
+                    str(session_id): session_id in marked
+                    for session_id in sorted(session_ids)
+                },
+            }
+        ),
+        200,
+    )
+
 
 @app.route("/sessions/<int:session_id>/attendances", methods=["GET"])
 @login_required
 def get_session_attendances(session_id):
     session_data = fetch_one(
-        "SELECT course_id, start_time, end_time FROM Sessions WHERE session_id = ?",
+        """
+        SELECT S.course_id, S.start_time, S.end_time, C.host_id
+        FROM Sessions S
+        LEFT JOIN Courses C ON S.course_id = C.course_id
+        WHERE S.session_id = ?
+        """,
         (session_id,),
     )
     if not session_data:
@@ -1221,23 +1754,32 @@ def get_session_attendances(session_id):
 
     # Only course host can view session attendances
     course_id = session_data["course_id"]
-    course = fetch_one("SELECT host_id FROM Courses WHERE course_id = ?", (course_id,))
-    if not course or course["host_id"] != g.user_id:
+    if session_data["host_id"] != g.user_id:
         return (
             jsonify({"error": "Access denied. You are not the host of this course."}),
             403,
         )
 
-    query = """
-        SELECT A.*, U.name AS user_name, U.email AS user_email
+    query = f"""
+        SELECT {attendance_columns()}, U.name AS user_name, U.email AS user_email
         FROM Attendances A
         JOIN Users U ON A.user_id = U.user_id
         WHERE A.session_id = ?
         ORDER BY A.joined_at ASC
     """
-    attendances = fetch_all(query, (session_id,))
-
-    if attendances:
+    # ?format=compact returns the column names once and each attendance as
+    # an array, which is much smaller and cheaper to build for large sessions
+    if request.args.get("format") == "compact":
+        columns, rows = fetch_all_compact(query, (session_id,))
+        if not rows:
+            return (
+                jsonify(
+                    {"message": "No attendance records found for this session."}
+                ),
+                404,
+            )
+        if wants_proof():
+            columns, rows = load_proofs_compact(columns, rows)
         return (
             jsonify(
                 {
@@ -1245,34 +1787,175 @@ def get_session_attendances(session_id):
                     "course_id": course_id,
                     "session_start_time": session_data["start_time"],
                     "session_end_time": session_data["end_time"],
-                    "attendances": [dict(a) for a in attendances],
+                    "columns": columns,
+                    "rows": rows,
                 }
             ),
             200,
         )
-    else:
+
+    attendances = iter_rows(query, (session_id,))
+    first = next(attendances, None)
+    if first is None:
         return (
             jsonify({"message": "No attendance records found for this session."}),
             404,
         )
 
+    # Serialize the session fields up front and stream the attendances array
+    # into the open object
+    head = orjson.dumps(
+        {
+            "session_id": session_id,
+            "course_id": course_id,
+            "session_start_time": session_data["start_time"],
+            "session_end_time": session_data["end_time"],
+        }
+    )
+    return (
+        stream_json_response(
+            chain([first], attendances),
+            head=head[:-1] + b',"attendances":[',
+            tail=b"]}",
+            transform=load_proof if wants_proof() else None,
+        ),
+        200,
+    )
 
-@app.route("/courses/<int:course_id>/attendance_summary", methods=["GET"])
+
+@app.route("/sessions/<int:session_id>/attendances/bulk_verify", methods=["GET"])
 @login_required
-def get_course_attendance_summary(course_id):
+def bulk_verify_attendances(session_id):
+    """
+    Allows a course host to re-check every geolocated attendance of a session
+    against the course location. All distances are computed in one vectorized
+    call instead of one haversine_distance call per attendee.
+    """
     course = fetch_one(
-        "SELECT host_id, name FROM Courses WHERE course_id = ?", (course_id,)
+        """
+        SELECT S.course_id, C.host_id, C.geolocation_latitude, C.geolocation_longitude
+        FROM Sessions S
+        LEFT JOIN Courses C ON S.course_id = C.course_id
+        WHERE S.session_id = ?
+        """,
+        (session_id,),
     )
     if not course:
-        return jsonify({"error": "Course not found."}), 404
+        return jsonify({"error": "Session not found."}), 404
 
-    is_host = course["host_id"] == g.user_id
-    is_enrolled = fetch_one(
-        "SELECT 1 FROM Enrollments WHERE user_id = ? AND course_id = ?",
-        (g.user_id, course_id),
+    # Only course host can verify session attendances
+    course_id = course["course_id"]
+    if course["host_id"] != g.user_id:
+        return (
+            jsonify({"error": "Access denied. You are not the host of this course."}),
+            403,
+        )
+
+    if (
+        course["geolocation_latitude"] is None
+        or course["geolocation_longitude"] is None
+    ):
+        return jsonify({"error": "This course has no geolocation set."}), 400
+
+    query = """
+        SELECT attendance_id, user_id, status,
+               user_geolocation_latitude, user_geolocation_longitude
+        FROM Attendances
+        WHERE session_id = ?
+        AND user_geolocation_latitude IS NOT NULL
+        AND user_geolocation_longitude IS NOT NULL
+        ORDER BY joined_at ASC
+    """
+    attendances = fetch_all(query, (session_id,))
+    if not attendances:
+        return (
+            jsonify({"message": "No geolocated attendance records for this session."}),
+            404,
+        )
+
+    # Records written before coordinates were validated may hold values that
+    # are not numbers; report those individually instead of failing the batch
+    verifications = []
+    located = []
+    for a in attendances:
+        verification = {
+            "attendance_id": a["attendance_id"],
+            "user_id": a["user_id"],
+            "status": a["status"],
+            "distance_km": None,
+            "within_proximity": False,
+        }
+        verifications.append(verification)
+        try:
+            point = (
+                float(a["user_geolocation_latitude"]),
+                float(a["user_geolocation_longitude"]),
+            )
+        except (ValueError, TypeError):
+            continue
+        located.append((verification, point))
+
+    if located:
+        try:
+            distances = haversine_distance_vec(
+                course["geolocation_latitude"],
+                course["geolocation_longitude"],
+                [point[0] for _, point in located],
+                [point[1] for _, point in located],
+            )
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid geolocation coordinates on record."}), 500
+
+        within_proximity = distances <= PROXIMITY_RADIUS_KM
+        for (verification, _), distance, within in zip(
+            located, distances, within_proximity
+        ):
+            verification["distance_km"] = float(distance)
+            verification["within_proximity"] = bool(within)
+
+    return (
+        jsonify(
+            {
+                "session_id": session_id,
+                "course_id": course_id,
+                "radius_km": PROXIMITY_RADIUS_KM,
+                "verifications": verifications,
+            }
+        ),
+        200,
     )
 
-    if not is_host and not is_enrolled:
+
+# Per-attendee attendance counts for a course. The user filter is skipped when
+# its parameter is NULL, so hosts and attendees share one prepared statement.
+# course_name is repeated on every row so the course needs no separate lookup.
+ATTENDANCE_SUMMARY_QUERY = """
+    SELECT U.user_id, U.name, U.email, C.name AS course_name,
+           COALESCE(SUM(A.status = 'Present'), 0) AS present_count,
+           COALESCE(SUM(A.status = 'Late'), 0) AS late_count,
+           COALESCE(SUM(A.status = 'Absent'), 0) AS absent_count,
+           COUNT(DISTINCT S.session_id) AS total_sessions
+    FROM Users U
+    JOIN Enrollments E ON U.user_id = E.user_id
+    JOIN Courses C ON C.course_id = E.course_id
+    LEFT JOIN Sessions S ON E.course_id = S.course_id AND S.course_id = ?
+    LEFT JOIN Attendances A ON S.session_id = A.session_id AND U.user_id = A.user_id
+    WHERE E.course_id = ? AND (? IS NULL OR U.user_id = ?)
+    GROUP BY U.user_id, U.name, U.email
+    ORDER BY U.name
+"""
+
+
+@app.route("/courses/<int:course_id>/attendance_summary", methods=["GET"])
+@login_required
+def get_course_attendance_summary(course_id):
+    course_role = get_course_role(g.user_id, course_id)
+    if not course_role:
+        return jsonify({"error": "Course not found."}), 404
+
+    is_host = course_role[0] == "host"
+
+    if course_role[0] == "none":
         return (
             jsonify(
                 {
@@ -1282,32 +1965,23 @@ def get_course_attendance_summary(course_id):
             403,
         )
 
-    # For host: get summary for all attendees
+    # Hosts get every attendee's summary, attendees only their own
+    only_user_id = None if is_host else g.user_id
+    summary_data = fetch_all(
+        ATTENDANCE_SUMMARY_QUERY, (course_id, course_id, only_user_id, only_user_id)
+    )
+    course_name = None
+    for row in summary_data:
+        course_name = row.pop("course_name")
+
     if is_host:
-        summary_query = """
-            SELECT U.user_id, U.name, U.email,
-                   COUNT(CASE WHEN A.status = 'Present' THEN 1 END) AS present_count,
-                   COUNT(CASE WHEN A.status = 'Late' THEN 1 END) AS late_count,
-                   COUNT(CASE WHEN A.status = 'Absent' THEN 1 END) AS absent_count,
-                   COUNT(DISTINCT S.session_id) AS total_sessions
-            FROM Users U
-            JOIN Enrollments E ON U.user_id = E.user_id
-            LEFT JOIN Sessions S ON E.course_id = S.course_id AND S.course_id = ?
-            LEFT JOIN Attendances A ON S.session_id = A.session_id AND U.user_id = A.user_id
-            WHERE E.course_id = ?
-            GROUP BY U.user_id, U.name, U.email
-            ORDER BY U.name
-        """
-        summary_data = fetch_all(summary_query, (course_id, course_id))
         if summary_data:
             return (
                 jsonify(
                     {
                         "course_id": course_id,
-                        "course_name": course["name"],
-                        "summary_for_all_attendees": [
-                            dict(row) for row in summary_data
-                        ],
+                        "course_name": course_name,
+                        "summary_for_all_attendees": summary_data,
                     }
                 ),
                 200,
@@ -1319,29 +1993,14 @@ def get_course_attendance_summary(course_id):
                 ),
                 404,
             )
-    # For attendee: get their own summary
     else:
-        summary_query = """
-            SELECT U.user_id, U.name, U.email,
-                   COUNT(CASE WHEN A.status = 'Present' THEN 1 END) AS present_count,
-                   COUNT(CASE WHEN A.status = 'Late' THEN 1 END) AS late_count,
-                   COUNT(CASE WHEN A.status = 'Absent' THEN 1 END) AS absent_count,
-                   COUNT(DISTINCT S.session_id) AS total_sessions
-            FROM Users U
-            JOIN Enrollments E ON U.user_id = E.user_id
-            LEFT JOIN Sessions S ON E.course_id = S.course_id AND S.course_id = ?
-            LEFT JOIN Attendances A ON S.session_id = A.session_id AND U.user_id = A.user_id
-            WHERE E.course_id = ? AND U.user_id = ?
-            GROUP BY U.user_id, U.name, U.email
-        """
-        summary_data = fetch_one(summary_query, (course_id, course_id, g.user_id))
         if summary_data:
             return (
                 jsonify(
                     {
                         "course_id": course_id,
-                        "course_name": course["name"],
-                        "your_attendance_summary": dict(summary_data),
+                        "course_name": course_name,
+                        "your_attendance_summary": summary_data[0],
                     }
                 ),
                 200,
@@ -1,58 +1,341 @@
 import sqlite3
 import os
+import queue
+import threading
+from contextlib import contextmanager
+
+from cachetools import TTLCache
+from flask import g, has_app_context
 
 DATABASE_NAME = "attendance.db"
 
+# Number of idle read connections kept open for reuse. Extra readers are opened
+# on demand under load and closed again when the pool is full.
+READ_POOL_SIZE = 4
+
+# Prepared statements kept per pooled connection, keyed by SQL text. The app
+# issues a few dozen distinct statements, so every one of them stays prepared
+# for the life of the connection (sqlite3's default is 128).
+CACHED_STATEMENTS = 256
+
+# Applied to every pooled connection when it is opened; these settings only
+# last for the connection. journal_mode=WAL is persistent and is set once by
+# initialize_db. foreign_keys is off by default in SQLite, and without it the
+# schema's ON DELETE CASCADE clauses never fire.
+CONNECTION_PRAGMAS = """
+    PRAGMA foreign_keys=ON;
+    PRAGMA synchronous=NORMAL;
+    PRAGMA cache_size=-65536;
+    PRAGMA mmap_size=268435456;
+    PRAGMA temp_store=MEMORY;
+"""
+
+_read_pool = queue.Queue(maxsize=READ_POOL_SIZE)
+_write_conn = None
+_write_lock = threading.Lock()
+
+# (user_id, course_id) -> (role, host_id), or None if the course does not exist.
+# Hosts and enrollments rarely change, so a short TTL also bounds how stale an
+# entry can get in other worker processes that did not see the invalidation.
+_course_role_cache = TTLCache(maxsize=10000, ttl=60)
+_course_role_lock = threading.Lock()
+# Bumped by every invalidation. A lookup only caches its result if no
+# invalidation happened while it was reading the database, so a stale read
+# cannot be stored after the invalidation that should have removed it.
+_course_role_generation = 0
+
+
+def dict_factory(cursor, row):
+    """Row factory that returns plain dicts, so results can go straight to jsonify."""
+    return {column[0]: value for column, value in zip(cursor.description, row)}
+
 
 def get_db_connection():
     """Establishes and returns a database connection."""
     conn = sqlite3.connect(DATABASE_NAME)
-    conn.row_factory = sqlite3.Row  # This allows us to access columns by name
+    conn.row_factory = dict_factory  # This allows us to access columns by name
     return conn
 
 
-def execute_query(query, params=()):
-    """Executes an INSERT, UPDATE, or DELETE query and commits the changes."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def _open_pooled_connection(read_only=False):
+    """Opens a connection for the pool: shareable across threads, autocommit."""
+    conn = sqlite3.connect(
+        DATABASE_NAME,
+        check_same_thread=False,
+        isolation_level=None,
+        cached_statements=CACHED_STATEMENTS,
+    )
+    conn.row_factory = dict_factory
+    conn.executescript(CONNECTION_PRAGMAS)
+    if read_only:
+        conn.execute("PRAGMA query_only=1")
+    return conn
+
+
+def _checkout_reader():
     try:
-        cursor.execute(query, params)
-        conn.commit()
-        return cursor.lastrowid  # Returns the ID of the last inserted row
-    except sqlite3.IntegrityError as e:
-        # Handle unique constraint violations or other integrity errors
-        raise ValueError(f"Database Integrity Error: {e}")
-    except sqlite3.Error as e:
-        # Catch other SQLite errors
-        raise RuntimeError(f"Database Error: {e}")
-    finally:
+        return _read_pool.get_nowait()
+    except queue.Empty:
+        return _open_pooled_connection(read_only=True)
+
+
+def _checkin_reader(conn):
+    try:
+        _read_pool.put_nowait(conn)
+    except queue.Full:
         conn.close()
 
 
-def fetch_one(query, params=()):
-    """Executes a SELECT query and fetches a single row."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
+@contextmanager
+def read_connection():
+    """
+    Yields a read-only connection from the pool. Inside an app context the
+    connection stays checked out on `g` for the rest of the request and is
+    returned by close_db; outside one it is returned immediately.
+    """
+    if has_app_context():
+        if "db_reader" not in g:
+            g.db_reader = _checkout_reader()
+        yield g.db_reader
+        return
+
+    conn = _checkout_reader()
     try:
-        cursor.execute(query, params)
-        return cursor.fetchone()
-    except sqlite3.Error as e:
-        raise RuntimeError(f"Database Error: {e}")
+        yield conn
     finally:
-        conn.close()
+        _checkin_reader(conn)
+
+
+@contextmanager
+def write_connection():
+    """Yields the single shared write connection, holding the write lock."""
+    global _write_conn
+    with _write_lock:
+        if _write_conn is None:
+            _write_conn = _open_pooled_connection()
+        yield _write_conn
+
+
+def close_db(exception=None):
+    """Returns the request's read connection to the pool."""
+    conn = g.pop("db_reader", None)
+    if conn is not None:
+        _checkin_reader(conn)
+
+
+def init_app(app):
+    """Registers the pool teardown with the Flask app."""
+    app.teardown_appcontext(close_db)
+
+
+def execute_query(query, params=()):
+    """Executes an INSERT, UPDATE, or DELETE query on the write connection."""
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.lastrowid  # Returns the ID of the last inserted row
+        except sqlite3.IntegrityError as e:
+            # Handle unique constraint violations or other integrity errors
+            raise ValueError(f"Database Integrity Error: {e}")
+        except sqlite3.Error as e:
+            # Catch other SQLite errors
+            raise RuntimeError(f"Database Error: {e}")
+        finally:
+            cursor.close()
+
+
+def execute_insert(query, params=()):
+    """
+    Executes an INSERT that may insert nothing (INSERT ... SELECT with a WHERE,
+    ON CONFLICT DO NOTHING). Returns the new row's ID, or None if no row was
+    inserted.
+    """
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            # lastrowid is left over from an earlier insert when nothing was inserted
+            return cursor.lastrowid if cursor.rowcount > 0 else None
+        except sqlite3.IntegrityError as e:
+            raise ValueError(f"Database Integrity Error: {e}")
+        except sqlite3.Error as e:
+            raise RuntimeError(f"Database Error: {e}")
+        finally:
+            cursor.close()
+
+
+def execute_delete_returning(delete_query, delete_params, select_query, select_params):
+    """
+    Reads rows with select_query and runs delete_query in one write
+    transaction, returning the rows read. Use it to collect data about rows a
+    cascading delete is about to remove, with no new row slipping in between.
+    """
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(select_query, select_params)
+            rows = cursor.fetchall()
+            cursor.execute(delete_query, delete_params)
+            cursor.execute("COMMIT")
+            return rows
+        except sqlite3.Error as e:
+            if conn.in_transaction:
+                conn.rollback()
+            if isinstance(e, sqlite3.IntegrityError):
+                raise ValueError(f"Database Integrity Error: {e}")
+            raise RuntimeError(f"Database Error: {e}")
+        finally:
+            cursor.close()
+
+
+def fetch_one(query, params=()):
+    """Executes a SELECT query and fetches a single row."""
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchone()
+        except sqlite3.Error as e:
+            raise RuntimeError(f"Database Error: {e}")
+        finally:
+            cursor.close()
 
 
 def fetch_all(query, params=()):
     """Executes a SELECT query and fetches all rows."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    try:
-        cursor.execute(query, params)
-        return cursor.fetchall()
-    except sqlite3.Error as e:
-        raise RuntimeError(f"Database Error: {e}")
-    finally:
-        conn.close()
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        except sqlite3.Error as e:
+            raise RuntimeError(f"Database Error: {e}")
+        finally:
+            cursor.close()
+
+
+def fetch_all_compact(query, params=()):
+    """
+    Executes a SELECT query and returns (column_names, rows), with each row
+    a plain tuple rather than a dict.
+    """
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        try:
+            cursor.execute(query, params)
+            return [column[0] for column in cursor.description], cursor.fetchall()
+        except sqlite3.Error as e:
+            raise RuntimeError(f"Database Error: {e}")
+        finally:
+            cursor.close()
+
+
+def iter_rows(query, params=(), chunk_size=1000):
+    """
+    Executes a SELECT query and yields its rows, fetching chunk_size rows at a
+    time so large results are never held in memory all at once.
+    """
+    with read_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield from rows
+        except sqlite3.Error as e:
+            raise RuntimeError(f"Database Error: {e}")
+        finally:
+            cursor.close()
+
+
+# Bound parameters per statement: SQLite builds before 3.32 allow at most 999.
+MAX_QUERY_PARAMS = 999
+
+
+def fetch_existing_attendance_sessions(user_id, session_ids):
+    """
+    Returns the set of session_ids, out of those given, for which the user
+    already has an attendance record. Uses one IN query per chunk of ids.
+    """
+    session_ids = list(session_ids)
+    chunk_size = MAX_QUERY_PARAMS - 1  # One parameter is the user_id
+    existing = set()
+    for start in range(0, len(session_ids), chunk_size):
+        chunk = session_ids[start : start + chunk_size]
+        placeholders = ", ".join(["?"] * len(chunk))
+        rows = fetch_all(
+            "SELECT session_id FROM Attendances "
+            f"WHERE user_id = ? AND session_id IN ({placeholders})",
+            (user_id, *chunk),
+        )
+        existing.update(row["session_id"] for row in rows)
+    return existing
+
+
+def get_course_role(user_id, course_id):
+    """
+    Returns (role, host_id) for a user in a course, where role is "host",
+    "enrolled" or "none", or None if the course does not exist. Results are
+    cached; endpoints that change hosts or enrollments must call
+    invalidate_course_role.
+    """
+    key = (user_id, course_id)
+    with _course_role_lock:
+        if key in _course_role_cache:
+            return _course_role_cache[key]
+        generation = _course_role_generation
+
+    course = fetch_one(
+        """
+        SELECT C.host_id, (E.user_id IS NOT NULL) AS is_enrolled
+        FROM Courses C
+        LEFT JOIN Enrollments E ON E.course_id = C.course_id AND E.user_id = ?
+        WHERE C.course_id = ?
+        """,
+        (user_id, course_id),
+    )
+    if course is None:
+        result = None
+    elif course["host_id"] == user_id:
+        result = ("host", course["host_id"])
+    elif course["is_enrolled"]:
+        result = ("enrolled", course["host_id"])
+    else:
+        result = ("none", course["host_id"])
+
+    with _course_role_lock:
+        if generation == _course_role_generation:
+            _course_role_cache[key] = result
+    return result
+
+
+def invalidate_course_role(user_id=None, course_id=None):
+    """
+    Drops cached roles for a user, a course, or one (user, course) pair.
+    With no arguments the whole cache is cleared.
+    """
+    global _course_role_generation
+    with _course_role_lock:
+        _course_role_generation += 1
+        if user_id is None and course_id is None:
+            _course_role_cache.clear()
+            return
+        if user_id is not None and course_id is not None:
+            _course_role_cache.pop((user_id, course_id), None)
+            return
+        stale_keys = [
+            key
+            for key in _course_role_cache
+            if (user_id is None or key[0] == user_id)
+            and (course_id is None or key[1] == course_id)
+        ]
+        for key in stale_keys:
+            _course_role_cache.pop(key, None)
 
 
 def create_tables():
@@ -83,6 +366,9 @@ def create_tables():
             join_code TEXT NOT NULL UNIQUE,
             geolocation_latitude REAL,
             geolocation_longitude REAL,
+            geo_lat_rad REAL, -- Prepared location for proximity checks
+            geo_lon_rad REAL,
+            geo_cos_lat REAL,
             created_at INTEGER DEFAULT (strftime('%s', 'now')),
             late_threshold_minutes INTEGER DEFAULT 10,
             present_threshold_minutes INTEGER DEFAULT 0,
@@ -129,7 +415,8 @@ def create_tables():
             late_minutes INTEGER,
             user_geolocation_latitude REAL,
             user_geolocation_longitude REAL,
-            proof_base64 BLOB,
+            proof_base64 BLOB, -- Inline proofs from before proof_path
+            proof_path TEXT, -- Proof file written by the app
             joined_at INTEGER DEFAULT (strftime('%s', 'now')),
             UNIQUE (session_id, user_id),
             FOREIGN KEY (session_id) REFERENCES Sessions(session_id) ON DELETE CASCADE,
@@ -138,15 +425,58 @@ def create_tables():
     """
     )
 
+    # Indexes for the hot lookups. Enrollments(user_id, course_id) is already
+    # covered by its primary key, Attendances(session_id, user_id) by its UNIQUE
+    # constraint, and Users.email / Courses.join_code by theirs.
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_enrollments_course_user ON Enrollments(course_id, user_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_sessions_course_start ON Sessions(course_id, start_time DESC)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_attendances_user ON Attendances(user_id, joined_at DESC)"
+    )
+    # Lets the attendance summary read status without visiting the table rows
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_attendances_session_user_status ON Attendances(session_id, user_id, status)"
+    )
+
+    # Columns added after the initial schema, for databases created before them
+    _add_column_if_missing(cursor, "Courses", "geo_lat_rad", "REAL")
+    _add_column_if_missing(cursor, "Courses", "geo_lon_rad", "REAL")
+    _add_column_if_missing(cursor, "Courses", "geo_cos_lat", "REAL")
+    _add_column_if_missing(cursor, "Attendances", "proof_path", "TEXT")
+
     conn.commit()
     conn.close()
     print(f"Database '{DATABASE_NAME}' and tables created/verified.")
 
 
+def _add_column_if_missing(cursor, table, column, definition):
+    """Adds a column to an existing table unless it is already there."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in [row["name"] for row in cursor.fetchall()]:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
 def initialize_db():
-    """Initializes the database by creating tables."""
+    """Initializes the database: switches it to WAL, creates tables, analyzes."""
+    conn = get_db_connection()
+    # WAL lets readers run alongside the writer; it is stored in the database
+    # file, so every later connection (and process) picks it up
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.close()
     create_tables()
 
+    # Refresh planner statistics. Without them SQLite favours the UNIQUE
+    # (session_id, user_id) index over the covering one for the summary.
+    # analysis_limit samples each index, so this stays fast on large tables.
+    conn = get_db_connection()
+    conn.execute("PRAGMA analysis_limit=400")
+    conn.execute("ANALYZE")
+    conn.close()
+
 
 if __name__ == "__main__":
     initialize_db()